@@ -1,58 +1,115 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import numpy as np
-import pickle
+import io
+import json
 import os
 
-# Import TFLite runtime for Raspberry Pi Zero
+import inference
+from schema import REQUIRED_FIELDS, decode_reading
+
+# orjson serializes large responses several times faster than the stdlib json
 try:
-    import tflite_runtime.interpreter as tflite
-    TFLITE_AVAILABLE = True
+    import orjson
 except ImportError:
-    print("tflite_runtime is not available, trying tensorflow.lite...")
-    try:
-        import tensorflow.lite as tflite
-        TFLITE_AVAILABLE = True
-    except ImportError:
-        print("No TFLite runtime available!")
-        TFLITE_AVAILABLE = False
-        tflite = None
+    orjson = None
+
+# ijson parses large /batch_predict bodies incrementally instead of all at once
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 app = Flask(__name__)
 
-# Load TFLite model and scaler at startup
-MODEL_PATH = "udare_model.tflite"
-SCALER_PATH = "scaler.pkl"
+# /batch_predict bodies above STREAM_THRESHOLD bytes are parsed, predicted and
+# answered STREAM_CHUNK measurements at a time to bound memory use
+STREAM_THRESHOLD = 64 * 1024
+STREAM_CHUNK = 32
+
+
+def json_response(payload, status=200):
+    """jsonify() replacement that serializes with orjson when it is installed"""
+    if orjson is None:
+        return jsonify(payload), status
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
+
+def dumps(payload):
+    """Serialize payload to JSON bytes, with orjson when it is installed"""
+    if orjson is None:
+        return json.dumps(payload).encode()
+    return orjson.dumps(payload)
+
+
+def missing_fields(rows, offset=0):
+    """Return the error for the first measurement missing a field, or None"""
+    for i, data in enumerate(rows):
+        if not all(field in data for field in REQUIRED_FIELDS):
+            return f"Missing fields at input {offset + i}. Required: {REQUIRED_FIELDS}"
+    return None
+
+
+def predict_rows(rows):
+    """Predict a non-empty list of measurements with a single run_model() call"""
+    input_data = inference.input_buffer(len(rows))
+    for i, d in enumerate(rows):
+        input_data[i] = (float(d["temperature"]), float(d["air_humidity"]), float(d["luminosity"]))
+    
+    predictions = inference.run_model(input_data)
+    should_water = predictions >= 0.5
+    
+    return [
+        {
+            "should_water": bool(should),
+            "probability": float(prediction),
+            "input": {
+                "temperature": float(d["temperature"]),
+                "air_humidity": float(d["air_humidity"]),
+                "luminosity": float(d["luminosity"])
+            }
+        }
+        for d, prediction, should in zip(rows, predictions, should_water)
+    ]
+
 
-interpreter = None
-input_details = None
-output_details = None
+def iter_chunks(stream):
+    """Parse the "data" list of a JSON body incrementally, STREAM_CHUNK items at a time"""
+    chunk = []
+    # Buffered so ijson's read(0) probe does not look like a client disconnect
+    for row in ijson.items(io.BufferedReader(stream), "data.item", use_float=True):
+        chunk.append(row)
+        if len(chunk) == STREAM_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
-if TFLITE_AVAILABLE:
+
+def stream_predictions(first_results, chunks):
+    """
+    Yield the /batch_predict JSON response one chunk of measurements at a time
+
+    The status code is already sent by the time later chunks are parsed, so an
+    invalid measurement there ends the list and adds an "error" field instead.
+    """
+    yield b'{"predictions":[' + b",".join(dumps(r) for r in first_results)
+    total = len(first_results)
+    error = None
+    
     try:
-        # Load TFLite model
-        interpreter = tflite.Interpreter(model_path=MODEL_PATH)
-        interpreter.allocate_tensors()
-        
-        # Get input/output details
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-        
-        print(f" TFLite model loaded from {MODEL_PATH}")
-        print(f"  Input shape: {input_details[0]['shape']}")
-        print(f"  Output shape: {output_details[0]['shape']}")
+        for chunk in chunks:
+            error = missing_fields(chunk, total)
+            if error:
+                break
+            yield b"," + b",".join(dumps(r) for r in predict_rows(chunk))
+            total += len(chunk)
     except Exception as e:
-        print(f" Error loading TFLite model: {e}")
-        interpreter = None
-else:
-    print(" TFLite runtime is not available")
-
-try:
-    with open(SCALER_PATH, "rb") as f:
-        scaler = pickle.load(f)
-    print(f" Scaler loaded from {SCALER_PATH}")
-except Exception as e:
-    print(f" Error loading scaler: {e}")
-    scaler = None
+        error = f"Invalid data: {str(e)}"
+    
+    tail = {"total": total}
+    if error:
+        tail["error"] = error
+    yield b"]," + dumps(tail)[1:]
 
 
 @app.route("/")
@@ -61,8 +118,9 @@ def home():
     return jsonify({
         "status": "running",
         "service": "Automated Watering System API (TFLite)",
-        "model_loaded": interpreter is not None,
-        "scaler_loaded": scaler is not None,
+        "model_loaded": inference.model_loaded(),
+        "backend": inference.BACKEND,
+        "quant_loaded": inference.quant_loaded,
         "optimized_for": "Raspberry Pi Zero (ARMv6/ARMv7)"
     })
 
@@ -70,8 +128,8 @@ def home():
 @app.route("/health")
 def health():
     """Health check endpoint"""
-    if interpreter is None or scaler is None:
-        return jsonify({"status": "unhealthy", "reason": "Model or scaler not loaded"}), 500
+    if not inference.model_loaded() or not inference.quant_loaded:
+        return jsonify({"status": "unhealthy", "reason": "Model or input encoding not loaded"}), 500
     return jsonify({"status": "healthy"}), 200
 
 
@@ -87,47 +145,29 @@ def predict():
         "luminosity": 800.0
     }
     """
-    if interpreter is None or scaler is None:
+    if not inference.model_loaded() or not inference.quant_loaded:
         return jsonify({
-            "error": "Model or scaler not available"
+            "error": "Model or input encoding not available"
         }), 500
     
     try:
-        # Get data from request
-        data = request.get_json()
+        # Validate and convert the request in one pass; the same values are
+        # echoed back in the response
+        try:
+            temperature, air_humidity, luminosity = decode_reading(request.get_data())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Validate data
-        required_fields = ["temperature", "air_humidity", "luminosity"]
-        if not all(field in data for field in required_fields):
-            return jsonify({
-                "error": f"Missing required fields. Required: {required_fields}"
-            }), 400
-        
-        # Prepare data for prediction
-        input_data = np.array([[
-            float(data["temperature"]),
-            float(data["air_humidity"]),
-            float(data["luminosity"])
-        ]], dtype=np.float32)
+        # Normalize data and make prediction
+        prediction = inference.predict_reading(temperature, air_humidity, luminosity)
         
-        # Normalize data
-        input_scaled = scaler.transform(input_data).astype(np.float32)
-        
-        # Make prediction with TFLite
-        interpreter.set_tensor(input_details[0]['index'], input_scaled)
-        interpreter.invoke()
-        prediction = interpreter.get_tensor(output_details[0]['index'])[0][0]
-        
-        # Convert to boolean (threshold 0.5)
-        should_water = bool(prediction >= 0.5)
-        
-        return jsonify({
-            "should_water": should_water,
-            "probability": float(prediction),
+        return json_response({
+            "should_water": prediction >= 0.5,
+            "probability": prediction,
             "input": {
-                "temperature": float(data["temperature"]),
-                "air_humidity": float(data["air_humidity"]),
-                "luminosity": float(data["luminosity"])
+                "temperature": temperature,
+                "air_humidity": air_humidity,
+                "luminosity": luminosity
             }
         })
     
@@ -153,13 +193,54 @@ def batch_predict():
             {"temperature": 30.0, "air_humidity": 30.0, "luminosity": 1000.0}
         ]
     }
+    
+    Alternatively, with Content-Type: application/octet-stream, the body is
+    N rows of (temperature, air_humidity, luminosity) as little-endian float32
+    and the response is the N probabilities as little-endian float32.
+    
+    JSON bodies larger than STREAM_THRESHOLD are parsed and answered in chunks,
+    so memory use does not grow with the number of measurements.
     """
-    if interpreter is None or scaler is None:
+    if not inference.model_loaded() or not inference.quant_loaded:
         return jsonify({
-            "error": "Model or scaler not available"
+            "error": "Model or input encoding not available"
         }), 500
     
     try:
+        # Raw float32 rows skip JSON parsing entirely
+        if request.mimetype == "application/octet-stream":
+            payload = request.get_data(cache=False)
+            if len(payload) % 12:
+                return jsonify({
+                    "error": "Binary body must be N rows of 3 little-endian float32 values"
+                }), 400
+            
+            input_data = np.frombuffer(payload, dtype="<f4").reshape(-1, 3).astype(np.float32)
+            if len(input_data):
+                predictions = inference.run_model(input_data)
+            else:
+                predictions = np.empty(0)
+            return Response(predictions.astype("<f4").tobytes(), mimetype="application/octet-stream")
+        
+        # Large bodies: parse and answer incrementally
+        if ijson is not None and request.is_json and (request.content_length or 0) > STREAM_THRESHOLD:
+            chunks = iter_chunks(request.stream)
+            first = next(chunks, None)
+            if first is None:
+                return jsonify({
+                    "error": "Expecting a 'data' field with a list of measurements"
+                }), 400
+            
+            error = missing_fields(first)
+            if error:
+                return jsonify({"error": error}), 400
+            
+            first_results = predict_rows(first)
+            return Response(
+                stream_with_context(stream_predictions(first_results, chunks)),
+                mimetype="application/json"
+            )
+        
         # Get data from request
         request_data = request.get_json()
         
@@ -168,40 +249,20 @@ def batch_predict():
                 "error": "Expecting a 'data' field with a list of measurements"
             }), 400
         
-        results = []
-        required_fields = ["temperature", "air_humidity", "luminosity"]
+        rows = request_data["data"]
         
-        for i, data in enumerate(request_data["data"]):
-            # Validate data
-            if not all(field in data for field in required_fields):
-                return jsonify({
-                    "error": f"Missing fields at input {i}. Required: {required_fields}"
-                }), 400
-            
-            # Prepare data
-            input_data = np.array([[
-                float(data["temperature"]),
-                float(data["air_humidity"]),
-                float(data["luminosity"])
-            ]], dtype=np.float32)
-            
-            # Normalize and predict with TFLite
-            input_scaled = scaler.transform(input_data).astype(np.float32)
-            interpreter.set_tensor(input_details[0]['index'], input_scaled)
-            interpreter.invoke()
-            prediction = interpreter.get_tensor(output_details[0]['index'])[0][0]
-            
-            results.append({
-                "should_water": bool(prediction >= 0.5),
-                "probability": float(prediction),
-                "input": {
-                    "temperature": float(data["temperature"]),
-                    "air_humidity": float(data["air_humidity"]),
-                    "luminosity": float(data["luminosity"])
-                }
-            })
+        # Validate data
+        error = missing_fields(rows)
+        if error:
+            return jsonify({"error": error}), 400
         
-        return jsonify({
+        if not rows:
+            return jsonify({"predictions": [], "total": 0})
+        
+        # Normalize and predict the whole batch with a single invoke()
+        results = predict_rows(rows)
+        
+        return json_response({
             "predictions": results,
             "total": len(results)
         })
@@ -218,4 +279,5 @@ def batch_predict():
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    # Development server only, use start_api.sh (gunicorn) on the Pi
+    app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
\ No newline at end of file
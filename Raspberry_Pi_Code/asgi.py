@@ -0,0 +1,85 @@
+"""
+Minimal ASGI server for the Pi Zero: only /predict and /health, without Flask
+
+Run with: uvicorn asgi:app --workers 1 --loop uvloop --http httptools
+"""
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+import json
+
+import inference
+from schema import decode_reading
+
+# orjson serializes several times faster than the stdlib json
+try:
+    import orjson
+    dumps = orjson.dumps
+except ImportError:
+    def dumps(payload):
+        return json.dumps(payload).encode()
+
+
+def json_response(payload, status=200):
+    """Serialize payload as a JSON response"""
+    return Response(dumps(payload), status_code=status, media_type="application/json")
+
+
+async def health(request):
+    """Health check endpoint"""
+    if not inference.model_loaded() or not inference.quant_loaded:
+        return json_response({"status": "unhealthy", "reason": "Model or input encoding not loaded"}, 500)
+    return json_response({"status": "healthy"})
+
+
+async def predict(request):
+    """
+    Endpoint for prediction, same request and response as app.py
+
+    Expected JSON body:
+    {
+        "temperature": 25.5,
+        "air_humidity": 45.0,
+        "luminosity": 800.0
+    }
+    """
+    if not inference.model_loaded() or not inference.quant_loaded:
+        return json_response({
+            "error": "Model or input encoding not available"
+        }, 500)
+
+    try:
+        # Validate and convert the request in one pass
+        try:
+            temperature, air_humidity, luminosity = decode_reading(await request.body())
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+
+        # Inference takes microseconds, so it runs inline on the event loop;
+        # requests never overlap here, so there is nothing to micro-batch
+        prediction = inference.predict_one(temperature, air_humidity, luminosity)
+
+        return json_response({
+            "should_water": prediction >= 0.5,
+            "probability": prediction,
+            "input": {
+                "temperature": temperature,
+                "air_humidity": air_humidity,
+                "luminosity": luminosity
+            }
+        })
+
+    except ValueError as e:
+        return json_response({
+            "error": f"Invalid data: {str(e)}"
+        }, 400)
+    except Exception as e:
+        return json_response({
+            "error": f"Prediction error: {str(e)}"
+        }, 500)
+
+
+app = Starlette(routes=[
+    Route("/predict", predict, methods=["POST"]),
+    Route("/health", health),
+])
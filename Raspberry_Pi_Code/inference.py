@@ -0,0 +1,470 @@
+"""Model loading and inference shared by the Flask (app.py) and ASGI (asgi.py) servers"""
+import numpy as np
+from contextlib import contextmanager
+import platform
+import queue
+import threading
+import time
+import os
+
+# Import TFLite runtime for Raspberry Pi Zero
+try:
+    import tflite_runtime.interpreter as tflite
+    TFLITE_AVAILABLE = True
+except ImportError:
+    print("tflite_runtime is not available, trying tensorflow.lite...")
+    try:
+        import tensorflow.lite as tflite
+        TFLITE_AVAILABLE = True
+    except ImportError:
+        print("No TFLite runtime available!")
+        TFLITE_AVAILABLE = False
+        tflite = None
+
+# Numba compiles the MLP to native code (not available on ARMv6 / Pi Zero)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = not platform.machine().startswith("armv6")
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# cffi loads the C kernel generated by train.py and compiled by setup_pi.sh
+try:
+    import cffi
+    CFFI_AVAILABLE = True
+except ImportError:
+    CFFI_AVAILABLE = False
+
+# Load model and input encoding at startup
+MODEL_PATH = "udare_model.tflite"
+WEIGHTS_PATH = "weights.npz"
+KERNEL_PATH = "kernel.so"
+QUANT_PATH = "quant.npz"
+
+# Inference backend: "native" calls the C kernel compiled from kernel.c,
+# "numba" and "numpy" evaluate the tiny MLP directly from weights.npz, "tflite"
+# runs udare_model.tflite through the interpreter; each falls back to the next
+BACKEND = os.environ.get("BACKEND", "native")
+
+# Interpreter threads, defaults to one per CPU core (1 on Pi Zero, 4 on Pi 3/4/5)
+THREADS = int(os.environ.get("THREADS", max(1, os.cpu_count() or 1)))
+
+# Number of independent interpreters, so concurrent requests run in parallel on
+# separate arenas; the THREADS are split between them (one each by default)
+POOL_SIZE = int(os.environ.get("POOL_SIZE", max(1, os.cpu_count() or 1)))
+
+# Concurrent /predict calls on the TFLite backend are coalesced into batches of
+# up to BATCH_SIZE readings, waiting at most BATCH_TIMEOUT_MS for requests that
+# are already on their way to the queue; BATCH_SIZE=1 disables it
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 16))
+BATCH_TIMEOUT_MS = float(os.environ.get("BATCH_TIMEOUT_MS", 5))
+
+# An idle interpreter is invoked every KEEP_WARM_SECONDS so its arena stays
+# resident in memory and cache between sparse requests; 0 disables it
+KEEP_WARM_SECONDS = float(os.environ.get("KEEP_WARM_SECONDS", 2))
+
+native = None
+weights = None
+_model_bytes = None
+interpreters = []
+
+# An interpreter holds per-call state in its tensors, so each one serves a
+# single request at a time; the NumPy/Numba kernels need no pool
+_pool = queue.Queue()
+
+
+class PooledInterpreter:
+    """A TFLite interpreter with its own arena, tensor details and tensor accessors"""
+
+    def __init__(self, model_content, num_threads):
+        # The default op resolver applies the XNNPACK delegate (NEON kernels
+        # on ARM), which runs on num_threads cores
+        self.interpreter = tflite.Interpreter(model_content=model_content, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._refresh()
+
+        # Warm up once so the first request does not pay the kernel setup cost
+        self.interpreter.invoke()
+
+    def _refresh(self):
+        """Re-read the tensor details after the tensors are (re)allocated"""
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+
+        # Accessors for numpy views into the interpreter's own tensor buffers
+        self.tensor_in = self.interpreter.tensor(self.input_details[0]['index'])
+        self.tensor_out = self.interpreter.tensor(self.output_details[0]['index'])
+
+    def resize_input(self, batch_size):
+        """Resize the input tensor to batch_size rows, only when it actually changes"""
+        if batch_size != self.input_details[0]['shape'][0]:
+            self.interpreter.resize_tensor_input(self.input_details[0]['index'], [batch_size, 3])
+            self.interpreter.allocate_tensors()
+            self._refresh()
+
+    def encode_input(self, input_data):
+        """Scale and quantize raw readings for full INT8 models as clip(rint(x * a + b))"""
+        input_dtype = self.input_details[0]['dtype']
+        info = np.iinfo(input_dtype)
+        return np.clip(np.rint(input_data * _a + _b), info.min, info.max).astype(input_dtype)
+
+    def dequantize_output(self, output):
+        """Convert the model output back to float32 probabilities"""
+        if self.output_details[0]['dtype'] == np.float32:
+            return output
+        scale, zero_point = self.output_details[0]['quantization']
+        return (np.asarray(output, dtype=np.float32) - zero_point) * scale
+
+
+@contextmanager
+def _borrow():
+    """Take an idle interpreter from the pool for the duration of the block"""
+    itp = _pool.get()
+    try:
+        yield itp
+    finally:
+        _pool.put(itp)
+
+
+if BACKEND == "native" and not CFFI_AVAILABLE:
+    print(" cffi is not installed, falling back to Numba")
+    BACKEND = "numba"
+
+if BACKEND == "native":
+    try:
+        ffi = cffi.FFI()
+        ffi.cdef("void infer(const float *x, float *out, int n);")
+        native = ffi.dlopen(os.path.abspath(KERNEL_PATH))
+        print(f" Native model loaded from {KERNEL_PATH}")
+    except Exception as e:
+        print(f" Error loading native kernel: {e}, falling back to Numba")
+        BACKEND = "numba"
+
+if BACKEND == "numba" and not NUMBA_AVAILABLE:
+    print(" Numba is not available on this platform, falling back to NumPy")
+    BACKEND = "numpy"
+
+if BACKEND in ("numba", "numpy"):
+    try:
+        # Dense(8) -> Dense(4) -> Dense(1) kernels and biases exported by train.py
+        with np.load(WEIGHTS_PATH) as w:
+            weights = tuple(
+                np.ascontiguousarray(w[name], dtype=np.float32)
+                for name in ("W1", "b1", "W2", "b2", "W3", "b3")
+            )
+        print(f" {BACKEND.capitalize()} model loaded from {WEIGHTS_PATH}")
+    except Exception as e:
+        print(f" Error loading weights: {e}, falling back to TFLite")
+        BACKEND = "tflite"
+
+if BACKEND != "tflite":
+    pass
+elif TFLITE_AVAILABLE:
+    try:
+        # Read the model ourselves, asking the kernel to keep it in the page cache
+        with open(MODEL_PATH, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            _model_bytes = f.read()
+        
+        # Load TFLite models, all sharing the same model bytes
+        threads_each = max(1, THREADS // POOL_SIZE)
+        interpreters = [PooledInterpreter(_model_bytes, threads_each) for _ in range(POOL_SIZE)]
+        for itp in interpreters:
+            _pool.put(itp)
+        
+        print(f" TFLite model loaded from {MODEL_PATH}")
+        print(f"  Input shape: {interpreters[0].input_details[0]['shape']}")
+        print(f"  Output shape: {interpreters[0].output_details[0]['shape']}")
+        print(f"  Interpreters: {POOL_SIZE} x {threads_each} threads")
+    except Exception as e:
+        print(f" Error loading TFLite model: {e}")
+        interpreters = []
+else:
+    print(" TFLite runtime is not available")
+
+try:
+    # MinMax scaling x * scale + min, plus the same affine fused with the INT8
+    # input quantization (x * a + b) so int8 models encode raw readings in one pass
+    with np.load(QUANT_PATH) as q:
+        # Contiguous float32 vectors, so the elementwise multiply/add with the
+        # (N, 3) input rows stays on NumPy's SIMD inner loops
+        _scale = np.ascontiguousarray(q["scale"], dtype=np.float32)
+        _min_ = np.ascontiguousarray(q["min"], dtype=np.float32)
+        _a = np.ascontiguousarray(q["a"], dtype=np.float32)
+        _b = np.ascontiguousarray(q["b"], dtype=np.float32)
+        # Input quantization of the model the encoding was fused with,
+        # (0.0, 0) for float32 models like TFLite reports it
+        _in_quantization = (float(q["in_scale"]), int(q["in_zero_point"]))
+    quant_loaded = True
+    print(f" Input encoding loaded from {QUANT_PATH}")
+except Exception as e:
+    print(f" Error loading input encoding: {e}")
+    quant_loaded = False
+    _scale = _min_ = _a = _b = _in_quantization = None
+
+if interpreters and quant_loaded:
+    # The fused encoding is only valid for the model it was exported with
+    input_details = interpreters[0].input_details[0]
+    if tuple(input_details['quantization']) != _in_quantization:
+        print(f" Error: {QUANT_PATH} was exported for input quantization {_in_quantization}, "
+              f"but {MODEL_PATH} uses {tuple(input_details['quantization'])}")
+        quant_loaded = False
+    elif input_details['dtype'] != np.int8:
+        print(f" Note: {MODEL_PATH} is not INT8 quantized, retrain with train.py for the int8 kernels")
+
+
+_tls = threading.local()
+
+
+def input_buffer(rows):
+    """
+    Return a C-contiguous (rows, 3) float32 array for raw readings
+
+    Each thread reuses one preallocated buffer sized for a micro-batch, so the
+    request path does not allocate; larger batches get a fresh array. The
+    contents are only valid until the same thread calls input_buffer() again.
+    """
+    buf = getattr(_tls, "buf", None)
+    if buf is None:
+        buf = _tls.buf = np.empty((max(16, BATCH_SIZE), 3), dtype=np.float32)
+    if rows > len(buf):
+        return np.empty((rows, 3), dtype=np.float32)
+    return buf[:rows]
+
+
+def normalize(input_data):
+    """Apply the MinMax scaling to a float32 (N, 3) array in place"""
+    np.multiply(input_data, _scale, out=input_data)
+    np.add(input_data, _min_, out=input_data)
+    return input_data
+
+
+def model_loaded():
+    """True when the selected inference backend is ready"""
+    return native is not None or weights is not None or bool(interpreters)
+
+
+def native_infer(input_scaled):
+    """Run the compiled C kernel on a C-contiguous (N, 3) float32 batch"""
+    out = np.empty(input_scaled.shape[0], dtype=np.float32)
+    native.infer(ffi.from_buffer("float[]", input_scaled), ffi.from_buffer("float[]", out), len(out))
+    return out
+
+
+def infer(input_scaled):
+    """Evaluate sigmoid(relu(relu(x W1 + b1) W2 + b2) W3 + b3) for a (N, 3) batch"""
+    W1, b1, W2, b2, W3, b3 = weights
+    hidden = np.maximum(input_scaled @ W1 + b1, 0)
+    hidden = np.maximum(hidden @ W2 + b2, 0)
+    return 1 / (1 + np.exp(-(hidden @ W3 + b3)))
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def infer_row(x, W1, b1, W2, b2, W3, b3):
+        """Numba version of infer() for a single (3,) row, without temporary arrays"""
+        h1 = np.empty(b1.shape[0], dtype=np.float32)
+        for i in range(b1.shape[0]):
+            s = b1[i]
+            for k in range(x.shape[0]):
+                s += x[k] * W1[k, i]
+            h1[i] = s if s > 0 else 0.0
+
+        h2 = np.empty(b2.shape[0], dtype=np.float32)
+        for i in range(b2.shape[0]):
+            s = b2[i]
+            for k in range(h1.shape[0]):
+                s += h1[k] * W2[k, i]
+            h2[i] = s if s > 0 else 0.0
+
+        z = b3[0]
+        for k in range(h2.shape[0]):
+            z += h2[k] * W3[k, 0]
+        return 1.0 / (1.0 + np.exp(-z))
+
+    # Serial on purpose: batches are tens of rows, so prange dispatch costs more
+    # than it saves, and the workqueue threading layer aborts the process when
+    # several request threads enter a parallel kernel at once
+    @njit(cache=True, fastmath=True)
+    def batch_infer(X, W1, b1, W2, b2, W3, b3):
+        """Numba version of infer() for a (N, 3) batch"""
+        out = np.empty(X.shape[0], dtype=np.float32)
+        for n in range(X.shape[0]):
+            out[n] = infer_row(X[n], W1, b1, W2, b2, W3, b3)
+        return out
+
+if BACKEND == "numba":
+    # Compile (or load from the cache) both kernels now, so the first
+    # /predict and /batch_predict do not pay the JIT compile
+    _warm_up = np.zeros((1, 3), dtype=np.float32)
+    infer_row(_warm_up[0], *weights)
+    batch_infer(_warm_up, *weights)
+    del _warm_up
+
+
+def run_model(input_data):
+    """
+    Run the model on a (N, 3) float32 batch of raw readings and return N probabilities
+
+    input_data may be scaled in place.
+
+    Works with the C kernel, the Numba/NumPy weights, the float32 model and the
+    full INT8 model produced by train.py.
+    """
+    if native is not None:
+        return native_infer(normalize(input_data))
+    if BACKEND == "numba":
+        return batch_infer(normalize(input_data), *weights)
+    if weights is not None:
+        return infer(normalize(input_data)).reshape(-1)
+
+    with _borrow() as itp:
+        itp.resize_input(input_data.shape[0])
+        
+        if itp.input_details[0]['dtype'] == np.float32:
+            input_tensor = normalize(input_data)
+        else:
+            input_tensor = itp.encode_input(input_data)
+        itp.interpreter.set_tensor(itp.input_details[0]['index'], input_tensor)
+        itp.interpreter.invoke()
+        return itp.dequantize_output(itp.interpreter.get_tensor(itp.output_details[0]['index']).reshape(-1))
+
+
+def predict_one(temperature, air_humidity, luminosity):
+    """
+    Run a single measurement through the model and return its probability
+
+    The reading is written and scaled directly in the interpreter's input tensor,
+    avoiding the set_tensor/get_tensor copies. The arrays returned by tensor_in()
+    and tensor_out() are views into the interpreter arena and are only valid
+    until the next invoke(), so they must never be kept around.
+    """
+    if native is not None or weights is not None:
+        input_data = input_buffer(1)
+        input_data[0] = (temperature, air_humidity, luminosity)
+        normalize(input_data)
+        if native is not None:
+            return float(native_infer(input_data)[0])
+        if BACKEND == "numba":
+            return float(infer_row(input_data[0], *weights))
+        return float(infer(input_data)[0, 0])
+
+    with _borrow() as itp:
+        itp.resize_input(1)
+        
+        buf = itp.tensor_in()
+        if itp.input_details[0]['dtype'] == np.float32:
+            buf[0] = (temperature, air_humidity, luminosity)
+            normalize(buf)
+        else:
+            input_data = input_buffer(1)
+            input_data[0] = (temperature, air_humidity, luminosity)
+            buf[:] = itp.encode_input(input_data)
+        del buf  # invoke() refuses to run while views into the arena are alive
+        
+        itp.interpreter.invoke()
+        return float(itp.dequantize_output(itp.tensor_out()[0, 0]))
+
+
+_batch_queue = queue.Queue()
+_inflight = 0
+_queued = 0  # requests headed for the batch worker and not yet collected
+_inflight_lock = threading.Lock()
+
+
+def _batch_loop():
+    """
+    Worker thread: collect queued readings and predict them as one batch
+
+    Every queued caller blocks until its batch is done, so no more requests can
+    arrive than are already counted in _queued; collection stops as soon as all
+    of them are in, instead of always waiting out BATCH_TIMEOUT_MS.
+    """
+    global _queued
+    timeout = BATCH_TIMEOUT_MS / 1000
+    while True:
+        items = [_batch_queue.get()]
+        deadline = time.monotonic() + timeout
+        while len(items) < min(BATCH_SIZE, _queued):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(_batch_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        with _inflight_lock:
+            _queued -= len(items)
+        
+        try:
+            input_data = input_buffer(len(items))
+            for i, (features, _, _) in enumerate(items):
+                input_data[i] = features
+            predictions = run_model(input_data)
+            for (_, _, slot), prediction in zip(items, predictions):
+                slot[0] = float(prediction)
+        except Exception as e:
+            for _, _, slot in items:
+                slot[0] = e
+        
+        for _, done, _ in items:
+            done.set()
+
+
+# The C/Numba/NumPy kernels take microseconds per call, so coalescing their
+# requests would only add a thread hop
+_batch_worker = None
+if BATCH_SIZE > 1 and interpreters:
+    _batch_worker = threading.Thread(target=_batch_loop, name="batcher", daemon=True)
+    _batch_worker.start()
+
+
+def _keep_warm_loop():
+    """Worker thread: periodically invoke the idle interpreters, discarding the output"""
+    while True:
+        time.sleep(KEEP_WARM_SECONDS)
+        # The pool hands interpreters out in turn, so this touches each of them.
+        # Every request writes its own input first, so re-running whatever is in
+        # the input tensor is harmless. Shrinking back to one row releases the
+        # arena of a large /batch_predict instead of re-running it every time
+        for _ in range(len(interpreters)):
+            with _borrow() as itp:
+                itp.resize_input(1)
+                itp.interpreter.invoke()
+
+
+if interpreters and KEEP_WARM_SECONDS > 0:
+    threading.Thread(target=_keep_warm_loop, name="keep-warm", daemon=True).start()
+
+
+def predict_reading(temperature, air_humidity, luminosity):
+    """
+    Predict a single measurement, coalescing it with concurrent requests
+
+    A request that is alone runs straight through predict_one() so its latency
+    is unchanged; while others are in flight it is queued for the batch worker,
+    which pushes the whole batch through one interpreter. Set BATCH_SIZE=1 to
+    favour latency instead and let the interpreter pool run requests in parallel.
+    """
+    global _inflight, _queued
+    with _inflight_lock:
+        _inflight += 1
+        alone = _inflight == 1 or _batch_worker is None
+        if not alone:
+            _queued += 1
+    
+    try:
+        if alone:
+            return predict_one(temperature, air_humidity, luminosity)
+        
+        done = threading.Event()
+        slot = [None]
+        _batch_queue.put(((temperature, air_humidity, luminosity), done, slot))
+        done.wait()
+        if isinstance(slot[0], Exception):
+            raise slot[0]
+        return slot[0]
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
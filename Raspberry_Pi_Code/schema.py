@@ -0,0 +1,44 @@
+"""Request parsing shared by the Flask (app.py) and ASGI (asgi.py) servers"""
+import json
+import math
+
+REQUIRED_FIELDS = ["temperature", "air_humidity", "luminosity"]
+
+# msgspec validates a /predict body and converts its fields in a single C pass
+try:
+    import msgspec
+
+    class Reading(msgspec.Struct):
+        temperature: float
+        air_humidity: float
+        luminosity: float
+
+    _reading_decoder = msgspec.json.Decoder(Reading)
+except ImportError:
+    msgspec = None
+
+
+def decode_reading(body):
+    """
+    Parse a /predict JSON body into (temperature, air_humidity, luminosity) floats
+
+    Raises ValueError for malformed JSON, missing fields and non-numeric values.
+    """
+    if msgspec is not None:
+        reading = _reading_decoder.decode(body)
+        return reading.temperature, reading.air_humidity, reading.luminosity
+
+    # Reject what msgspec rejects: numeric strings, booleans, NaN and infinities
+    data = json.loads(body)
+    if not isinstance(data, dict) or not all(field in data for field in REQUIRED_FIELDS):
+        raise ValueError(f"Missing required fields. Required: {REQUIRED_FIELDS}")
+    values = []
+    for field in REQUIRED_FIELDS:
+        value = data[field]
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f"Expected a number for `{field}`, got {type(value).__name__}")
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(f"Expected a finite number for `{field}`")
+        values.append(value)
+    return tuple(values)
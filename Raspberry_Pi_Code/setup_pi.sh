@@ -54,9 +54,23 @@ fi
 # Install remaining dependencies
 echo ""
 echo "   Installing Flask and dependencies..."
-pip install Flask==2.3.3 Werkzeug==2.3.7
-pip install numpy==1.24.3 scikit-learn==1.3.0
-pip install requests==2.31.0
+pip install Flask==2.3.3 Werkzeug==2.3.7 gunicorn==21.2.0
+pip install numpy==1.24.3
+pip install requests==2.31.0 ijson==3.2.3
+
+# msgspec is optional, /predict falls back to manual validation without it
+pip install msgspec || echo "   [WARNING] msgspec not available, using manual validation"
+
+# orjson is optional, the API falls back to the standard json module without it
+pip install orjson || echo "   [WARNING] orjson not available, using the standard json module"
+
+# The ASGI server (SERVER=asgi bash start_api.sh) is optional
+pip install starlette uvicorn uvloop httptools || echo "   [WARNING] ASGI server not available, using gunicorn"
+
+# Numba is optional (no ARMv6 wheels), the API falls back to NumPy without it
+if [ "$(uname -m)" != "armv6l" ]; then
+    pip install numba || echo "   [WARNING] numba not available, using the NumPy backend"
+fi
 
 # 4. Check if model exists
 echo ""
@@ -64,19 +78,33 @@ echo "[4/5] Verifying model files..."
 if [ ! -f "udare_model.tflite" ]; then
     echo "   [ERROR] udare_model.tflite DOES NOT EXIST!"
     echo "   [INFO] Train model on laptop with: python train.py"
-    echo "   [INFO] Then transfer udare_model.tflite and scaler.pkl here"
+    echo "   [INFO] Then transfer udare_model.tflite and quant.npz here"
     exit 1
 fi
 
-if [ ! -f "scaler.pkl" ]; then
-    echo "   [ERROR] scaler.pkl DOES NOT EXIST!"
+if [ ! -f "quant.npz" ]; then
+    echo "   [ERROR] quant.npz DOES NOT EXIST!"
     echo "   [INFO] Train model on laptop with: python train.py"
-    echo "   [INFO] Then transfer udare_model.tflite and scaler.pkl here"
+    echo "   [INFO] Then transfer udare_model.tflite and quant.npz here"
     exit 1
 fi
 
 echo "   [OK] udare_model.tflite found"
-echo "   [OK] scaler.pkl found"
+echo "   [OK] quant.npz found"
+
+# Optional: compile the C kernel generated by train.py for the native backend
+if [ -f "kernel.c" ]; then
+    case "$(uname -m)" in
+        armv6l)  ARCH_FLAGS="-mfpu=vfp -mfloat-abi=hard" ;;
+        armv7l)  ARCH_FLAGS="-mfpu=neon-vfpv4 -mfloat-abi=hard" ;;
+        *)       ARCH_FLAGS="-march=native" ;;
+    esac
+    if pip install cffi && gcc -O3 -ffast-math $ARCH_FLAGS -shared -fPIC kernel.c -o kernel.so -lm; then
+        echo "   [OK] kernel.so compiled"
+    else
+        echo "   [WARNING] Could not compile kernel.c, the native backend is disabled"
+    fi
+fi
 
 # 5. Quick test
 echo ""
@@ -13,15 +13,38 @@ fi
 if [ ! -f "udare_model.tflite" ]; then
     echo "[ERROR] TFLite model does not exist!"
     echo "[INFO] Train on laptop: python train.py"
-    echo "[INFO] Transfer udare_model.tflite and scaler.pkl to Pi"
+    echo "[INFO] Transfer udare_model.tflite and quant.npz to Pi"
     exit 1
 fi
 
+PORT=${PORT:-5000}
+
+# HTTP threads: JSON parsing and network I/O overlap with inference.
+# Pi Zero has a single core, so 2 threads are enough to hide that work.
+if [ -z "$WEB_THREADS" ]; then
+    if [ "$(nproc)" -le 1 ]; then
+        WEB_THREADS=2
+    else
+        WEB_THREADS=8
+    fi
+fi
+
 # Activate virtual environment and start API
 echo "[START] Starting Automated Watering System API..."
-echo "[INFO] Location: http://$(hostname -I | awk '{print $1}'):5000"
+echo "[INFO] Location: http://$(hostname -I | awk '{print $1}'):${PORT}"
 echo "[INFO] Stop with: Ctrl+C"
 echo ""
 
 source venv/bin/activate
-python app.py
+
+# A single worker on purpose: every extra worker loads its own copy of the
+# model and interpreter arena, which the Pi Zero's 512 MB cannot spare
+if [ "$SERVER" = "asgi" ] && command -v uvicorn > /dev/null; then
+    # Minimal ASGI server (/predict and /health only) for the Pi Zero
+    exec uvicorn asgi:app --workers 1 --loop uvloop --http httptools --host 0.0.0.0 --port "${PORT}"
+elif command -v gunicorn > /dev/null; then
+    exec gunicorn -k gthread -w 1 --threads "${WEB_THREADS}" -b "0.0.0.0:${PORT}" app:app
+else
+    echo "[WARNING] gunicorn not installed, using the Flask development server"
+    exec python app.py
+fi
@@ -5,22 +5,79 @@ from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
-import pickle
+
+def c_array(values):
+    """Format a NumPy array as a nested C initializer list"""
+    if values.ndim == 1:
+        return "{" + ", ".join(f"{v:.9e}f" for v in values) + "}"
+    return "{" + ", ".join(c_array(row) for row in values) + "}"
+
+
+def write_c_kernel(path, W1, b1, W2, b2, W3, b3):
+    """
+    Write a C version of the network with the trained weights baked in
+
+    setup_pi.sh compiles it on the Pi into kernel.so for the "native" backend.
+    All shapes are compile-time constants, so the compiler fully unrolls the loops.
+    """
+    n_in, n_h1 = W1.shape
+    n_h2 = W2.shape[1]
+    source = f"""#include <math.h>
+
+/* Generated by train.py, do not edit: Dense({n_h1}) -> Dense({n_h2}) -> Dense(1) */
+static const float W1[{n_in}][{n_h1}] = {c_array(W1)};
+static const float b1[{n_h1}] = {c_array(b1)};
+static const float W2[{n_h1}][{n_h2}] = {c_array(W2)};
+static const float b2[{n_h2}] = {c_array(b2)};
+static const float W3[{n_h2}][1] = {c_array(W3)};
+static const float b3[1] = {c_array(b3)};
+
+/* Probabilities for n rows of {n_in} scaled inputs */
+void infer(const float *x, float *out, int n)
+{{
+    for (int r = 0; r < n; r++, x += {n_in}) {{
+        float h1[{n_h1}], h2[{n_h2}];
+
+        for (int i = 0; i < {n_h1}; i++) {{
+            float s = b1[i];
+            for (int k = 0; k < {n_in}; k++)
+                s += x[k] * W1[k][i];
+            h1[i] = s > 0.0f ? s : 0.0f;
+        }}
+
+        for (int i = 0; i < {n_h2}; i++) {{
+            float s = b2[i];
+            for (int k = 0; k < {n_h1}; k++)
+                s += h1[k] * W2[k][i];
+            h2[i] = s > 0.0f ? s : 0.0f;
+        }}
+
+        float z = b3[0];
+        for (int k = 0; k < {n_h2}; k++)
+            z += h2[k] * W3[k][0];
+        out[r] = 1.0f / (1.0f + expf(-z));
+    }}
+}}
+"""
+    with open(path, "w") as f:
+        f.write(source)
+
 
 def train_model():
-    # Load data
-    data = pd.read_csv("water_data.csv")
+    # Load data directly as float32, the precision used for inference
+    data = pd.read_csv("water_data.csv", dtype={
+        "temperature": np.float32,
+        "air_humidity": np.float32,
+        "luminosity": np.float32,
+        "should_water": np.float32
+    })
 
-    X = data[["temperature", "air_humidity", "luminosity"]]
-    y = data["should_water"]
+    X = data[["temperature", "air_humidity", "luminosity"]].values
+    y = data["should_water"].values
 
-    # Normalization
+    # Normalization (float32 in, so scaler.scale_ / min_ are float32 too)
     scaler = MinMaxScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    # Save scaler for use in inference
-    with open("scaler.pkl", "wb") as f:
-        pickle.dump(scaler, f)
+    X_scaled = scaler.fit_transform(X).astype(np.float32, copy=False)
 
     # Train-test split
     X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.2, random_state=42)
@@ -37,6 +94,13 @@ def train_model():
     # Training
     history = model.fit(X_train, y_train, epochs=50, batch_size=8, validation_data=(X_test, y_test))
 
+    # Export the raw Dense weights for the NumPy inference backend
+    (W1, b1), (W2, b2), (W3, b3) = (layer.get_weights() for layer in model.layers)
+    np.savez("weights.npz", W1=W1, b1=b1, W2=W2, b2=b2, W3=W3, b3=b3)
+
+    # ... and as C source for the native backend
+    write_c_kernel("kernel.c", W1, b1, W2, b2, W3, b3)
+
     # Testing
     loss, acc = model.evaluate(X_test, y_test)
     print(f"\n{'='*50}")
@@ -47,24 +111,53 @@ def train_model():
     # Save model for Raspberry Pi
     model.save("udare_model.h5")
     print("Model saved as 'udare_model.h5'")
-    print("Scaler saved as 'scaler.pkl'")
+    print("Weights saved as 'weights.npz'")
+    print("C kernel saved as 'kernel.c'")
     
     # Convert to TensorFlow Lite for Raspberry Pi Zero
     print("\nConverting model to TensorFlow Lite...")
     converter = tf.lite.TFLiteConverter.from_keras_model(model)
     
-    # Optimizations for Raspberry Pi Zero (ARMv6)
+    # Full INT8 post-training quantization for Raspberry Pi Zero (ARMv6/ARMv7):
+    # int8 weights and activations use the integer kernels instead of float32 ones
+    def representative_dataset():
+        for row in X_train[:200]:
+            yield [row.reshape(1, 3).astype(np.float32)]
+    
     converter.optimizations = [tf.lite.Optimize.DEFAULT]
-    converter.target_spec.supported_types = [tf.float32]  # Use float32 for compatibility
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    # MLIR quantizer: emits the int8 requantize pattern the ARM NEON kernels
+    # implement with a single rounding multiply (VQRDMULH)
+    converter.experimental_new_quantizer = True
     
     tflite_model = converter.convert()
     
+    # Make sure the model really takes int8, or the fused encoding below is wrong
+    input_details = tf.lite.Interpreter(model_content=tflite_model).get_input_details()[0]
+    if input_details['dtype'] != np.int8:
+        raise RuntimeError(f"Expected an int8 model input, got {input_details['dtype']}")
+    
     # Save TFLite model
     with open("udare_model.tflite", "wb") as f:
         f.write(tflite_model)
     
     print(f"[OK] TFLite model saved as 'udare_model.tflite' ({len(tflite_model)} bytes)")
-    print(f"[OK] Model optimized for Raspberry Pi Zero (ARMv6/ARMv7)")
+    print("[OK] Model quantized to INT8 for Raspberry Pi Zero (ARMv6/ARMv7)")
+    
+    # Fold the MinMax scaling into the int8 input quantization:
+    # q = (x * scale_ + min_) / in_scale + in_zero_point = x * a + b
+    in_scale, in_zero_point = input_details['quantization']
+    a = scaler.scale_ / in_scale
+    b = scaler.min_ / in_scale + in_zero_point
+    
+    # Save input encoding for use in inference (replaces the pickled scaler),
+    # together with the model quantization it was fused with
+    np.savez("quant.npz", scale=scaler.scale_, min=scaler.min_, a=a, b=b,
+             in_scale=in_scale, in_zero_point=in_zero_point)
+    print("[OK] Input encoding saved as 'quant.npz'")
 
 if __name__ == "__main__":
     train_model()